@@ -1,26 +1,103 @@
+import os
+import orjson
 import psutil
+import socket
 import time
 import requests
-import json
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.connectionpool import HTTPConnectionPool
 
 # Configure logging to display timestamps and log levels
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Upper bound on concurrent requests, matched by the connection pool size below
+MAX_WORKERS = 16
+
+# When set, requests to the enrollment server go over this UNIX domain socket instead of TCP
+UNIX_SOCKET_PATH = os.environ.get('OFA_UNIX_SOCKET')
+
+# urllib3 connection that dials a UNIX domain socket instead of host:port
+class _UnixHTTPConnection(HTTPConnection):
+    def __init__(self, *args, socket_path, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.socket_path = socket_path
+
+    def _new_conn(self):
+        """Open the socket connection to the server's socket file."""
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            if self.timeout is None or isinstance(self.timeout, (int, float)):
+                sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+class _UnixHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _UnixHTTPConnection
+
+# Transport adapter that sends every request for its mount prefix over a UNIX socket
+class UnixSocketAdapter(HTTPAdapter):
+    def __init__(self, socket_path, **kwargs):
+        super().__init__(**kwargs)
+        self._unix_pool = _UnixHTTPConnectionPool('localhost', maxsize=MAX_WORKERS, socket_path=socket_path)
+
+    def get_connection_with_tls_context(self, request, verify, proxies=None, cert=None):
+        """Return the UNIX socket pool regardless of the request URL."""
+        return self._unix_pool
+
+    def get_connection(self, url, proxies=None):
+        """Return the UNIX socket pool (for requests releases before 2.32)."""
+        return self._unix_pool
+
+    def close(self):
+        """Close the pooled UNIX socket connections along with the adapter."""
+        super().close()
+        self._unix_pool.close()
+
+# Shared HTTP session so repeated calls reuse keep-alive connections
+_SESSION = requests.Session()
+_ADAPTER = HTTPAdapter(pool_connections=4, pool_maxsize=MAX_WORKERS)
+_SESSION.mount('http://', _ADAPTER)
+_SESSION.mount('https://', _ADAPTER)
+if UNIX_SOCKET_PATH:
+    _SESSION.mount('http://localhost:5001/', UnixSocketAdapter(UNIX_SOCKET_PATH))
+
+# Seconds between background CPU/RAM samples
+SAMPLE_INTERVAL = 1.0
+
+# Latest (cpu_usage, ram_usage) pair, replaced as a whole so readers never see a torn update
+# cpu_usage stays None until the first full interval has been measured
+_resource_sample = (None, psutil.virtual_memory().percent)
+
+def _sample_system_resources():
+    """Refresh the cached CPU and RAM usage every SAMPLE_INTERVAL seconds."""
+    global _resource_sample
+    while True:
+        cpu_usage = psutil.cpu_percent(interval=SAMPLE_INTERVAL)
+        _resource_sample = (cpu_usage, psutil.virtual_memory().percent)
+
+threading.Thread(target=_sample_system_resources, daemon=True).start()
+
 # Log system resource usage (CPU and RAM)
 def log_system_resources():
-    """Log the current CPU and RAM usage."""
-    cpu_usage = psutil.cpu_percent(interval=1)
-    ram_usage = psutil.virtual_memory().percent
-    logging.info(f"CPU Usage: {cpu_usage}%")
-    logging.info(f"RAM Usage: {ram_usage}%")
+    """Log the most recent CPU and RAM usage sampled in the background (CPU is None before the first sample)."""
+    cpu_usage, ram_usage = _resource_sample
+    if cpu_usage is not None:
+        logging.info("CPU Usage: %s%%", cpu_usage)
+    logging.info("RAM Usage: %s%%", ram_usage)
     return cpu_usage, ram_usage
 
 # Log the time taken to process a request
 def log_request_time(start_time, end_time, url):
     """Log the duration of a request for a given URL."""
     processing_time = end_time - start_time
-    logging.info(f"Request time for {url}: {processing_time:.4f} seconds")
+    logging.info("Request time for %s: %.4f seconds", url, processing_time)
 
 # Enroll a user by sending their data to the server
 def enroll(user_name, crypto_commitment):
@@ -32,64 +109,57 @@ def enroll(user_name, crypto_commitment):
         crypto_commitment (str): The cryptographic commitment.
     """
     server_url = 'http://localhost:5001/enroll'
-    headers = {'Content-Type': 'application/json'}
     payload = {'user_name': user_name, 'crypto_commitment': crypto_commitment}
 
     start_time = time.time()
     log_system_resources()
 
     try:
-        response = requests.post(server_url, headers=headers, data=json.dumps(payload))
+        response = _SESSION.post(server_url, json=payload)
         response.raise_for_status()
 
         end_time = time.time()
         log_request_time(start_time, end_time, server_url)
         log_system_resources()
 
-        response_data = response.json()
+        response_data = orjson.loads(response.content)
         if 'message' in response_data:
-            logging.info(f"Enrollment successful: {response_data['message']}")
+            logging.info("Enrollment successful: %s", response_data['message'])
         else:
             logging.error("No 'message' found in response during enrollment.")
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Error enrolling: {e}")
+    except (requests.exceptions.RequestException, orjson.JSONDecodeError) as e:
+        logging.error("Error enrolling: %s", e)
 
 # Verify user credentials during sign-in
 def sign_in(user_name, user_secret):
     """
-    Verify a user's credentials by generating a commitment and sending it to the server.
+    Verify a user's credentials by sending their secret to the server, which generates and checks the commitment.
 
     Args:
         user_name (str): The user's name.
         user_secret (int): The user's secret value.
     """
-    crypto_commitment = generate_crypto_commitment(user_secret)
-    if not crypto_commitment:
-        logging.error("Failed to generate crypto commitment for sign-in.")
-        return
-
     start_time = time.time()
     log_system_resources()
 
-    server_url = 'http://localhost:5001/verifyCommitment'
-    headers = {'Content-Type': 'application/json'}
-    payload = {'user_name': user_name, 'crypto_commitment': crypto_commitment}
+    server_url = 'http://localhost:5001/signIn'
+    payload = {'user_name': user_name, 'user_secret': user_secret}
 
     try:
-        response = requests.post(server_url, headers=headers, data=json.dumps(payload))
+        response = _SESSION.post(server_url, json=payload)
         response.raise_for_status()
 
         end_time = time.time()
         log_request_time(start_time, end_time, server_url)
         log_system_resources()
 
-        response_data = response.json()
+        response_data = orjson.loads(response.content)
         if 'message' in response_data:
-            logging.info(f"Sign-in successful: {response_data['message']}")
+            logging.info("Sign-in successful: %s", response_data['message'])
         else:
             logging.error("No 'message' found in response during sign-in.")
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Error signing in: {e}")
+    except (requests.exceptions.RequestException, orjson.JSONDecodeError) as e:
+        logging.error("Error signing in: %s", e)
 
 # Generate a cryptographic commitment based on the user's secret
 def generate_crypto_commitment(user_secret):
@@ -106,18 +176,79 @@ def generate_crypto_commitment(user_secret):
     params = {'user_secret': user_secret}
 
     try:
-        response = requests.get(url, params=params)
+        response = _SESSION.get(url, params=params)
         response.raise_for_status()
-        data = response.json()
+        data = orjson.loads(response.content)
         if 'crypto_commitment' in data:
             return data['crypto_commitment']
         else:
             logging.error("Crypto commitment not found in response.")
             return None
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Error generating crypto commitment: {e}")
+    except (requests.exceptions.RequestException, orjson.JSONDecodeError) as e:
+        logging.error("Error generating crypto commitment: %s", e)
         return None
 
+# Sign up a user by generating their commitment and enrolling it
+def sign_up(user_name, user_secret):
+    """
+    Generate a cryptographic commitment for the user's secret and enroll it on the server.
+
+    Args:
+        user_name (str): The user's name.
+        user_secret (int): The user's secret value.
+    """
+    crypto_commitment = generate_crypto_commitment(user_secret)
+
+    if crypto_commitment:
+        logging.info("Generated crypto commitment: %s", crypto_commitment)
+        enroll(user_name, crypto_commitment)
+    else:
+        logging.error("Failed to generate crypto commitment during sign-up.")
+
+# Sign up many users at once with a single enrollment request
+def bulk_enroll(users):
+    """
+    Generate commitments for several users concurrently, then enroll them all in one request.
+
+    Args:
+        users (iterable): Pairs of (user_name, user_secret).
+    """
+    users = list(users)
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        commitments = list(executor.map(generate_crypto_commitment, [user_secret for _, user_secret in users]))
+
+    batch = []
+    for (user_name, _), crypto_commitment in zip(users, commitments):
+        if crypto_commitment:
+            batch.append({'user_name': user_name, 'crypto_commitment': crypto_commitment})
+        else:
+            logging.error("Failed to generate crypto commitment for %s during bulk sign-up.", user_name)
+    if not batch:
+        return
+
+    server_url = 'http://localhost:5001/enrollBatch'
+
+    start_time = time.time()
+    log_system_resources()
+
+    try:
+        response = _SESSION.post(server_url, json={'users': batch})
+        response.raise_for_status()
+
+        end_time = time.time()
+        log_request_time(start_time, end_time, server_url)
+        log_system_resources()
+
+        for result in orjson.loads(response.content).get('results', []):
+            if result.get('status') == 201:
+                logging.info("Enrollment successful for %s", result.get('user_name'))
+            elif result.get('status') == 409:
+                logging.error("Enrollment failed for %s: user already exists", result.get('user_name'))
+            else:
+                logging.error("Enrollment failed for %s: missing username or crypto commitment", result.get('user_name'))
+    except (requests.exceptions.RequestException, orjson.JSONDecodeError) as e:
+        logging.error("Error enrolling batch: %s", e)
+
 # Main function to manage user interactions for sign-up and sign-in
 def main():
     """Provide a menu-driven interface for user sign-up and sign-in."""
@@ -135,13 +266,7 @@ def main():
             logging.error("Invalid secret format. Please enter a number.")
             return
 
-        crypto_commitment = generate_crypto_commitment(user_secret)
-
-        if crypto_commitment:
-            logging.info(f"Generated crypto commitment: {crypto_commitment}")
-            enroll(user_name, crypto_commitment)
-        else:
-            logging.error("Failed to generate crypto commitment during sign-up.")
+        sign_up(user_name, user_secret)
 
     elif choice == '2':
         user_name = input("Enter username: ")
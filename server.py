@@ -1,36 +1,127 @@
 import sqlite3
-import json
+import hmac
+import http.client
+import os
+import queue
 import psutil
 import time
 import logging
-from http.server import BaseHTTPRequestHandler, HTTPServer
+import orjson
+import socket
+import socketserver
+import stat
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlencode
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 # Configure logging with timestamps and message levels
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+DB_PATH = 'commitments.db'
+DB_POOL_SIZE = 4
+
+# Commitment generator service called by /signIn
+GENERATOR_HOST = 'localhost'
+GENERATOR_PORT = 8080
+GENERATOR_POOL_SIZE = 4
+
+# When set, the server listens on this UNIX domain socket instead of TCP (for co-located clients)
+UNIX_SOCKET_PATH = os.environ.get('OFA_UNIX_SOCKET')
+
+# Statement text is kept identical across calls so each pooled connection's statement cache hits
+_INSERT_IF_NEW_SQL = 'INSERT INTO user_commitments (user_name, crypto_commitment) VALUES (?, ?) ON CONFLICT(user_name) DO NOTHING'
+_SELECT_SQL = 'SELECT crypto_commitment FROM user_commitments WHERE user_name = ?'
+
+# Pool of open connections shared by the request handler threads
+_conn_pool = queue.Queue(maxsize=DB_POOL_SIZE)
+
+def _open_conn():
+    """Open a database connection that may be used from any handler thread."""
+    db_conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    # WAL lets readers run alongside a writer, so NORMAL sync is still safe and fsyncs far less
+    db_conn.execute('PRAGMA synchronous=NORMAL')
+    db_conn.execute('PRAGMA temp_store=MEMORY')
+    db_conn.execute('PRAGMA cache_size=-20000')
+    return db_conn
+
+# Borrow a pooled connection for the duration of a block
+@contextmanager
+def get_conn():
+    """
+    Yield a pooled connection, opening a new one if the pool is empty.
+
+    Writers also enter the connection itself (`with get_conn() as db_conn, db_conn:`) so their
+    transaction commits on success and rolls back on error instead of going back to the pool open.
+    """
+    try:
+        db_conn = _conn_pool.get_nowait()
+    except queue.Empty:
+        db_conn = _open_conn()
+    try:
+        yield db_conn
+    finally:
+        try:
+            _conn_pool.put_nowait(db_conn)
+        except queue.Full:
+            db_conn.close()
+
+# Fixed JSON response bodies, encoded once instead of on every request
+RESP_MISSING_ENROLL_FIELDS = b'{"error": "Missing username or crypto commitment"}'
+RESP_USER_EXISTS = b'{"error": "User already exists"}'
+RESP_ENROLL_OK = b'{"message": "Crypto commitment and username saved successfully!"}'
+RESP_MISSING_USERNAME = b'{"error": "Missing username"}'
+RESP_MISSING_USERS = b'{"error": "Missing users list"}'
+RESP_LOGIN_OK = b'{"message": "Login Successful"}'
+RESP_UNAUTHORIZED = b'{"error": "Unauthorized"}'
+RESP_MISSING_SIGN_IN_FIELDS = b'{"error": "Missing username or secret"}'
+RESP_GENERATOR_UNAVAILABLE = b'{"error": "Could not generate crypto commitment"}'
+RESP_NOT_FOUND = b'{"error": "Not found"}'
+RESP_STATUS = b"Server is running"
+
 # Initialize the SQLite database and create the table if it doesn't exist
 def init_db():
-    """Initialize the database and ensure the user_commitments table exists."""
-    db_conn = sqlite3.connect('commitments.db')
-    db_cursor = db_conn.cursor()
-    db_cursor.execute('''
-        CREATE TABLE IF NOT EXISTS user_commitments (
-            id INTEGER PRIMARY KEY,
-            user_name TEXT NOT NULL,
-            crypto_commitment TEXT NOT NULL
-        )
-    ''')
-    db_conn.commit()
-    db_conn.close()
-
-# Save a user's cryptographic commitment to the database
-def save_crypto_commitment(user_name, crypto_commitment):
-    """Insert a user's name and their cryptographic commitment into the database."""
-    db_conn = sqlite3.connect('commitments.db')
-    db_cursor = db_conn.cursor()
-    db_cursor.execute('INSERT INTO user_commitments (user_name, crypto_commitment) VALUES (?, ?)', (user_name, crypto_commitment))
-    db_conn.commit()
-    db_conn.close()
+    """Initialize the database, ensure the user_commitments table exists and fill the connection pool."""
+    with get_conn() as db_conn, db_conn:
+        journal_mode = db_conn.execute('PRAGMA journal_mode=WAL').fetchone()[0]
+        if journal_mode.lower() != 'wal':
+            logging.warning("Could not enable WAL mode, journal mode is %s", journal_mode)
+        db_conn.execute('''
+            CREATE TABLE IF NOT EXISTS user_commitments (
+                id INTEGER PRIMARY KEY,
+                user_name TEXT NOT NULL,
+                crypto_commitment TEXT NOT NULL
+            )
+        ''')
+        # Unique index keeps username lookups off a full table scan and backs ON CONFLICT(user_name)
+        db_conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_user_commitments_user_name ON user_commitments(user_name)')
+    while not _conn_pool.full():
+        _conn_pool.put_nowait(_open_conn())
+
+# Save a commitment only if the username is not taken yet
+def save_if_new(user_name, crypto_commitment):
+    """
+    Insert a user's name and commitment unless the username already exists.
+
+    Returns:
+        bool: True if the user was enrolled, False if the username was taken.
+    """
+    with get_conn() as db_conn, db_conn:
+        db_cursor = db_conn.execute(_INSERT_IF_NEW_SQL, (user_name, crypto_commitment))
+        return db_cursor.rowcount == 1
+
+# Save many commitments in a single transaction
+def save_batch_if_new(users):
+    """
+    Insert several (user_name, crypto_commitment) pairs, skipping usernames that already exist.
+
+    All rows are written in one transaction, so the batch costs a single commit.
+
+    Returns:
+        list: One bool per pair, True if that user was enrolled.
+    """
+    with get_conn() as db_conn, db_conn:
+        return [db_conn.execute(_INSERT_IF_NEW_SQL, user).rowcount == 1 for user in users]
 
 # Retrieve the stored commitment for a user from the database
 def verify_crypto_commitment(user_name):
@@ -40,105 +131,236 @@ def verify_crypto_commitment(user_name):
     Returns:
         str: The stored commitment if found, otherwise None.
     """
-    db_conn = sqlite3.connect('commitments.db')
-    db_cursor = db_conn.cursor()
-    db_cursor.execute('SELECT crypto_commitment FROM user_commitments WHERE user_name = ?', (user_name,))
-    stored_crypto_commitment = db_cursor.fetchone()
-    db_conn.close()
+    with get_conn() as db_conn:
+        stored_crypto_commitment = db_conn.execute(_SELECT_SQL, (user_name,)).fetchone()
 
     if stored_crypto_commitment:
         return stored_crypto_commitment[0]
     return None
 
-# Check if a user already exists in the database
-def user_exists(user_name):
-    """Verify if a username exists in the database."""
-    db_conn = sqlite3.connect('commitments.db')
-    db_cursor = db_conn.cursor()
-    db_cursor.execute('SELECT 1 FROM user_commitments WHERE user_name = ?', (user_name,))
-    exists = db_cursor.fetchone() is not None
-    db_conn.close()
-    return exists
+# Compare a provided commitment with the one stored for the user
+def commitment_matches(user_name, crypto_commitment):
+    """Check whether crypto_commitment equals the commitment stored for user_name."""
+    stored_crypto_commitment = verify_crypto_commitment(user_name)
+    # Constant-time compare so response timing does not leak how much of the commitment matched
+    return (stored_crypto_commitment is not None and isinstance(crypto_commitment, str)
+            and hmac.compare_digest(stored_crypto_commitment.encode(), crypto_commitment.encode()))
+
+# Keep-alive connections to the generator, shared by all handler threads
+_generator_pool = queue.Queue(maxsize=GENERATOR_POOL_SIZE)
+
+# Borrow a pooled generator connection for the duration of a block
+@contextmanager
+def get_generator_conn(fresh=False):
+    """
+    Yield a pooled connection to the generator, opening a new one if the pool is empty or fresh is set.
+
+    A connection that raises is closed instead of being returned to the pool.
+    """
+    gen_conn = None
+    if not fresh:
+        try:
+            gen_conn = _generator_pool.get_nowait()
+        except queue.Empty:
+            pass
+    if gen_conn is None:
+        gen_conn = http.client.HTTPConnection(GENERATOR_HOST, GENERATOR_PORT, timeout=10)
+    try:
+        yield gen_conn
+    except BaseException:
+        gen_conn.close()
+        raise
+    try:
+        _generator_pool.put_nowait(gen_conn)
+    except queue.Full:
+        gen_conn.close()
+
+# Close every idle pooled generator connection
+def _drain_generator_pool():
+    """Close and discard all idle connections in the generator pool."""
+    while True:
+        try:
+            _generator_pool.get_nowait().close()
+        except queue.Empty:
+            return
+
+# Generate a cryptographic commitment by calling the generator service
+def generate_crypto_commitment(user_secret):
+    """
+    Ask the commitment generator for the commitment of a user's secret.
+
+    Returns:
+        str: The generated commitment, or None if the generator could not be reached or failed.
+    """
+    path = '/generateCommitment?' + urlencode({'user_secret': user_secret})
+    # A failed pooled connection usually means the generator restarted and every idle socket is dead,
+    # so the pool is drained and the retry goes out on a fresh connection
+    for attempt in range(2):
+        try:
+            with get_generator_conn(fresh=bool(attempt)) as gen_conn:
+                gen_conn.request('GET', path)
+                response = gen_conn.getresponse()
+                body = response.read()
+            break
+        except (http.client.HTTPException, OSError) as e:
+            if attempt:
+                logging.error("Error generating crypto commitment: %s", e)
+                return None
+            _drain_generator_pool()
+
+    if response.status != 200:
+        logging.error("Commitment generator returned status %s", response.status)
+        return None
+    try:
+        data = orjson.loads(body)
+    except orjson.JSONDecodeError as e:
+        logging.error("Invalid response from commitment generator: %s", e)
+        return None
+    if not isinstance(data, dict):
+        logging.error("Invalid response from commitment generator: expected a JSON object")
+        return None
+    return data.get('crypto_commitment')
+
+# How often the background thread samples server CPU/RAM, in seconds
+SAMPLE_INTERVAL = 1.0
+
+# Last sample as a (cpu_usage, ram_usage) tuple; handler threads only read it, never touch psutil
+# No CPU figure exists before the first interval completes, so cpu_usage starts as None
+_resource_sample = (None, psutil.virtual_memory().percent)
+
+def _sample_system_resources():
+    """Refresh the cached CPU and RAM usage every SAMPLE_INTERVAL seconds."""
+    global _resource_sample
+    while True:
+        cpu_usage = psutil.cpu_percent(interval=SAMPLE_INTERVAL)
+        _resource_sample = (cpu_usage, psutil.virtual_memory().percent)
+
+threading.Thread(target=_sample_system_resources, daemon=True).start()
 
 # Log the server's CPU and RAM usage
 def log_system_resources():
-    """Log the current CPU and RAM usage of the server."""
-    cpu_usage = psutil.cpu_percent(interval=1)
-    ram_usage = psutil.virtual_memory().percent
-    logging.info(f"Server CPU Usage: {cpu_usage}%")
-    logging.info(f"Server RAM Usage: {ram_usage}%")
+    """Log the most recent CPU and RAM usage of the server sampled in the background (CPU is None before the first sample)."""
+    cpu_usage, ram_usage = _resource_sample
+    if cpu_usage is not None:
+        logging.info("Server CPU Usage: %s%%", cpu_usage)
+    logging.info("Server RAM Usage: %s%%", ram_usage)
     return cpu_usage, ram_usage
 
 # Log the time taken to process a request
 def log_request_time(start_time, end_time, url):
     """Log the duration of a request for a specific endpoint."""
     processing_time = end_time - start_time
-    logging.info(f"Request time for {url}: {processing_time:.4f} seconds")
+    logging.info("Request time for %s: %.4f seconds", url, processing_time)
 
 # Custom HTTP request handler for enrollment and verification
 class RequestHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps the connection open between requests, so clients skip a TCP handshake each time
+    protocol_version = 'HTTP/1.1'
+    # Seconds an idle keep-alive connection may hold its handler thread before it is dropped
+    timeout = 30
+
+    def _read_json(self):
+        """Read exactly Content-Length bytes of the body and parse them as JSON."""
+        content_length = int(self.headers['Content-Length'])
+        # orjson parses the UTF-8 bytes directly, without decoding to str first
+        return orjson.loads(self.rfile.read(content_length))
+
+    def _send_bytes(self, status, content_type, body):
+        """Send a response, writing status line, headers and body in a single write."""
+        self.log_request(status)
+        reason = self.responses[status][0].encode()
+        connection = b"close" if self.close_connection else b"keep-alive"
+        self.wfile.write(b"%s %d %s\r\nDate: %s\r\nContent-Type: %s\r\nContent-Length: %d\r\nConnection: %s\r\n\r\n%s" % (
+            self.protocol_version.encode(), status, reason, self.date_time_string().encode(),
+            content_type, len(body), connection, body))
+
+    def _send_json(self, status, body):
+        """Send a JSON response with a precomputed body."""
+        self._send_bytes(status, b"application/json", body)
+
     def do_POST(self):
-        """Handle POST requests for enrollment and verification."""
+        """Handle POST requests for single and batch enrollment, verification and sign-in."""
         start_time = time.time()
 
         if self.path == '/enroll':
             # Handle user enrollment
-            content_length = int(self.headers['Content-Length'])
-            body = self.rfile.read(content_length).decode('utf-8')
-            data = json.loads(body)
+            data = self._read_json()
 
             user_name = data.get('user_name')
             crypto_commitment = data.get('crypto_commitment')
 
             if not user_name or not crypto_commitment:
-                self.send_response(400)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({"error": "Missing username or crypto commitment"}).encode())
+                self._send_json(400, RESP_MISSING_ENROLL_FIELDS)
                 return
 
-            if user_exists(user_name):
-                self.send_response(409)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({"error": "User already exists"}).encode())
+            if not save_if_new(user_name, crypto_commitment):
+                self._send_json(409, RESP_USER_EXISTS)
                 return
 
-            save_crypto_commitment(user_name, crypto_commitment)
+            self._send_json(201, RESP_ENROLL_OK)
+
+        elif self.path == '/enrollBatch':
+            # Handle enrollment of several users in one request
+            data = self._read_json()
+
+            users = data.get('users')
+            if not isinstance(users, list):
+                self._send_json(400, RESP_MISSING_USERS)
+                return
 
-            self.send_response(201)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({"message": "Crypto commitment and username saved successfully!"}).encode())
+            results = [{"user_name": user.get('user_name') if isinstance(user, dict) else None, "status": 400} for user in users]
+            valid = [i for i, user in enumerate(users)
+                     if isinstance(user, dict)
+                     and isinstance(user.get('user_name'), str) and user['user_name']
+                     and isinstance(user.get('crypto_commitment'), str) and user['crypto_commitment']]
+            saved = save_batch_if_new([(users[i]['user_name'], users[i]['crypto_commitment']) for i in valid])
+            for i, was_saved in zip(valid, saved):
+                results[i]["status"] = 201 if was_saved else 409
+
+            self._send_json(200, orjson.dumps({"results": results}))
 
         elif self.path == '/verifyCommitment':
             # Handle commitment verification
-            content_length = int(self.headers['Content-Length'])
-            body = self.rfile.read(content_length).decode('utf-8')
-            data = json.loads(body)
+            data = self._read_json()
 
             user_name = data.get('user_name')
             crypto_commitment = data.get('crypto_commitment')
 
             if not user_name:
-                self.send_response(400)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({"error": "Missing username"}).encode())
+                self._send_json(400, RESP_MISSING_USERNAME)
+                return
+
+            if commitment_matches(user_name, crypto_commitment):
+                self._send_json(200, RESP_LOGIN_OK)
+            else:
+                self._send_json(403, RESP_UNAUTHORIZED)
+
+        elif self.path == '/signIn':
+            # Handle sign-in from the user's secret, generating the commitment server-side
+            data = self._read_json()
+
+            user_name = data.get('user_name')
+            user_secret = data.get('user_secret')
+
+            if not user_name or not isinstance(user_secret, int) or isinstance(user_secret, bool):
+                self._send_json(400, RESP_MISSING_SIGN_IN_FIELDS)
                 return
 
-            stored_crypto_commitment = verify_crypto_commitment(user_name)
+            crypto_commitment = generate_crypto_commitment(user_secret)
+            if crypto_commitment is None:
+                self._send_json(502, RESP_GENERATOR_UNAVAILABLE)
+                return
 
-            if stored_crypto_commitment == crypto_commitment:
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({"message": "Login Successful"}).encode())
+            if commitment_matches(user_name, crypto_commitment):
+                self._send_json(200, RESP_LOGIN_OK)
             else:
-                self.send_response(403)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({"error": "Unauthorized"}).encode())
+                self._send_json(403, RESP_UNAUTHORIZED)
+
+        else:
+            # The unread body would otherwise be parsed as the next request on this connection
+            self.close_connection = True
+            self._send_json(404, RESP_NOT_FOUND)
+            return
 
         # Log the processing time and system resources after handling the request
         end_time = time.time()
@@ -148,19 +370,59 @@ class RequestHandler(BaseHTTPRequestHandler):
     def do_GET(self):
         """Handle GET requests for server status."""
         if self.path == '/':
-            self.send_response(200)
-            self.send_header('Content-type', 'text/html')
-            self.end_headers()
-            self.wfile.write(b"Server is running")
+            self._send_bytes(200, b"text/html", RESP_STATUS)
+        else:
+            self._send_json(404, RESP_NOT_FOUND)
+
+# Threaded server that can queue a burst of new connections
+class AuthServer(ThreadingHTTPServer):
+    """ThreadingHTTPServer with a listen backlog large enough for concurrent clients."""
+    request_queue_size = 128
+
+# Threaded server for local clients, skipping the loopback TCP stack
+class UnixAuthServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Serve the same handler over a UNIX domain socket."""
+    daemon_threads = True
+    request_queue_size = 128
+
+    def server_bind(self):
+        """Remove a stale socket file left behind by a previous run before binding."""
+        try:
+            is_socket = stat.S_ISSOCK(os.stat(self.server_address).st_mode)
+        except FileNotFoundError:
+            is_socket = False
+        # Only a socket nobody is listening on is stale; anything else makes bind() fail as usual
+        if is_socket:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                try:
+                    probe.connect(self.server_address)
+                except ConnectionRefusedError:
+                    os.unlink(self.server_address)
+        super().server_bind()
+
+    def get_request(self):
+        """Accept a connection, giving it a placeholder address for request logging."""
+        request, _ = super().get_request()
+        return request, ('local', 0)
 
 # Start the server and handle requests
-def run(server_class=HTTPServer, handler_class=RequestHandler, port=5001):
-    """Initialize the database and start the HTTP server."""
+def run(server_class=AuthServer, handler_class=RequestHandler, port=5001, unix_socket=UNIX_SOCKET_PATH):
+    """Initialize the database and start the HTTP server on a TCP port or a UNIX socket."""
     init_db()
-    server_address = ('', port)
-    httpd = server_class(server_address, handler_class)
-    print(f'Starting server on port {port}...')
-    httpd.serve_forever()
+    if unix_socket:
+        httpd = UnixAuthServer(unix_socket, handler_class)
+        print(f'Starting server on {unix_socket}...')
+    else:
+        server_address = ('', port)
+        httpd = server_class(server_address, handler_class)
+        print(f'Starting server on port {port}...')
+    try:
+        httpd.serve_forever()
+    finally:
+        httpd.server_close()
+        _drain_generator_pool()
+        if unix_socket:
+            os.unlink(unix_socket)
 
 if __name__ == '__main__':
     run()